@@ -8,56 +8,110 @@ License: MIT
 import os
 import sys
 import json
-import argparse
-import pyperclip
-from datetime import datetime
+import string
+import itertools
 from pathlib import Path
 import logging
-import subprocess
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Set
+
+# Defaults shared by load_config() and --init-config; read-only so nobody
+# can change them for the rest of the process by accident
+_DEFAULT_CONFIG = MappingProxyType({
+    "save_dir": "~/Documents/clipboard_saves",
+    "file_template": "clip_{date}_{time}_{text:.20}.txt",
+    "max_filename_length": 50,
+    "notifications": True,
+    "log_level": "INFO",
+    "hotkeys": MappingProxyType({
+        "quick_save": "Ctrl+Alt+s",
+        "custom_save": "Ctrl+Alt+f"
+    })
+})
+
+# Accepted values for the "log_level" setting
+_LEVELS = {
+    "NOTSET": logging.NOTSET,
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARN": logging.WARN,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "FATAL": logging.FATAL,
+    "CRITICAL": logging.CRITICAL
+}
+
+# Directories already created (or found) by this process
+_ENSURED_DIRS: Set[str] = set()
+
+def _ensure_dir(path: Path) -> None:
+    """Create a directory and its parents, once per process"""
+    key = str(path)
+    if key in _ENSURED_DIRS:
+        return
+    # Usually only the leaf is missing (or nothing is), so try that first
+    try:
+        os.mkdir(key)
+    except FileExistsError:
+        pass
+    except FileNotFoundError:
+        os.makedirs(key, exist_ok=True)
+    _ENSURED_DIRS.add(key)
+
+def _is_save_entry(entry: os.DirEntry) -> bool:
+    """Whether a scandir entry is a saved clipboard file"""
+    return entry.name.endswith('.txt') and entry.is_file()
+
+class _SanitizeTable(dict):
+    """str.translate table that fills itself in on first sight of a character"""
+    
+    def __missing__(self, codepoint: int) -> str:
+        c = chr(codepoint)
+        value = c if c.isalnum() or c in (' ', '-', '_', '.') else '_'
+        self[codepoint] = value
+        return value
 
 class ClipboardSaver:
     
+    # Byte-level equivalent of _SanitizeTable for pure ASCII text
+    _BYTE_TABLE = bytes(
+        b if b < 128 and (chr(b).isalnum() or chr(b) in ' -_.') else ord('_')
+        for b in range(256)
+    )
+    
     def __init__(self, config_path: Optional[Path] = None):
         self.config = self.load_config(config_path)
+        self._trans_table = _SanitizeTable()
         self.setup_logging()
         self.setup_directories()
+        self.setup_template()
+        self.setup_state()
         
     def load_config(self, config_path: Optional[Path] = None) -> Dict[str, Any]:
         """Load configuration from file or use defaults"""
-        default_config = {
-            "save_dir": "~/Documents/clipboard_saves",
-            "file_template": "clip_{date}_{time}_{text:.15}.txt",
-            "max_filename_length": 50,
-            "notifications": True,
-            "log_level": "INFO",
-            "hotkeys": {
-                "quick_save": "Ctrl+Alt+S",
-                "custom_save": "Ctrl+Alt+F"
-            }
-        }
+        default_config = {**_DEFAULT_CONFIG, "hotkeys": dict(_DEFAULT_CONFIG["hotkeys"])}
         
         if config_path is None:
             config_path = Path.home() / ".config" / "clipboard-saver" / "config.json"
         
         config_path = config_path.expanduser()
         
-        if config_path.exists():
-            try:
-                with open(config_path, 'r', encoding='utf-8') as f:
-                    user_config = json.load(f)
-                    default_config.update(user_config)
-            except Exception as e:
-                print(f"Error loading config: {e}. Using defaults.", file=sys.stderr)
+        try:
+            user_config = json.loads(config_path.read_bytes())
+            default_config.update(user_config)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading config: {e}. Using defaults.", file=sys.stderr)
         
         return default_config
     
     def setup_logging(self) -> None:
         """Setup logging configuration"""
         log_dir = Path.home() / ".local" / "share" / "clipboard-saver"
-        log_dir.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(log_dir)
         
-        log_level = getattr(logging, self.config["log_level"].upper(), logging.INFO)
+        log_level = _LEVELS.get(self.config["log_level"].upper(), logging.INFO)
         
         logging.basicConfig(
             level=log_level,
@@ -72,43 +126,103 @@ class ClipboardSaver:
     def setup_directories(self) -> None:
         """Create necessary directories"""
         self.save_dir = Path(self.config["save_dir"]).expanduser()
-        self.save_dir.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(self.save_dir)
+        self._save_dir_str = str(self.save_dir)
         self.logger.info(f"Save directory: {self.save_dir}")
     
+    def setup_template(self) -> None:
+        """Parse the filename template once so saves don't have to"""
+        self._formatter = string.Formatter()
+        try:
+            self._template_parts = list(self._formatter.parse(self.config["file_template"]))
+        except ValueError as e:
+            self.logger.warning(f"Invalid file template: {e}. Using default.")
+            self._template_parts = list(self._formatter.parse("clip_{datetime}.txt"))
+        # Only the leading name matters here: "{text[0]}" still needs "text".
+        # Specs can hold fields of their own, as in "{text:.{width}}"
+        self._template_fields = set()
+        for _, field, spec, _ in self._template_parts:
+            nested = self._formatter.parse(spec) if spec and '{' in spec else ()
+            for name in [field, *(inner for _, inner, _, _ in nested)]:
+                if name:
+                    self._template_fields.add(name.partition('.')[0].partition('[')[0])
+    
+    def setup_state(self) -> None:
+        """Prepare the record of the last save, loaded lazily on first use"""
+        state_dir = Path.home() / ".local" / "share" / "clipboard-saver"
+        _ensure_dir(state_dir)
+        # Remembers the last quick save so repeated hotkey presses can be skipped
+        self.state_path = state_dir / "last_save"
+        self._last_hash: Optional[bytes] = None
+        self._last_path: Optional[str] = None
+    
+    def _render_template(self, template_vars: Dict[str, str]) -> str:
+        """Render the preparsed filename template, raising KeyError for unknown variables"""
+        pieces = []
+        for literal, field, spec, conversion in self._template_parts:
+            pieces.append(literal)
+            if field is not None:
+                try:
+                    value, _ = self._formatter.get_field(field, (), template_vars)
+                except IndexError as e:
+                    # Positional fields like "{0}" have nothing to refer to
+                    raise KeyError(field) from e
+                if '{' in spec:
+                    try:
+                        spec = self._formatter.vformat(spec, (), template_vars)
+                    except IndexError as e:
+                        raise KeyError(spec) from e
+                value = self._formatter.convert_field(value, conversion)
+                pieces.append(format(value, spec))
+        return "".join(pieces)
+    
     def sanitize_filename(self, text: str) -> str:
         """Sanitize text for use in filenames"""
-        # Remove or replace characters that are problematic in filenames
-        sanitized = "".join(
-            c if c.isalnum() or c in (' ', '-', '_', '.') else '_' 
-            for c in text
-        )
-        # Limit length
+        # Limit length first: the mapping is one-to-one per character, so only
+        # the part that survives truncation needs to be translated
         max_len = self.config["max_filename_length"]
-        return sanitized[:max_len].strip()
+        truncated = text[:max_len]
+        # Remove or replace characters that are problematic in filenames
+        try:
+            raw = truncated.encode('ascii')
+        except UnicodeEncodeError:
+            # Non-ASCII letters and digits are kept, which needs the str table
+            return truncated.translate(self._trans_table).strip()
+        return raw.translate(self._BYTE_TABLE).decode('ascii').strip()
     
     def create_filename(self, text: str) -> str:
         """Create filename based on template and clipboard content"""
-        sanitized_text = self.sanitize_filename(text)
+        from datetime import datetime
         
-        template_vars = {
-            "date": datetime.now().strftime("%Y-%m-%d"),
-            "time": datetime.now().strftime("%H-%M-%S"),
-            "datetime": datetime.now().strftime("%Y%m%d_%H%M%S"),
-            "timestamp": str(int(datetime.now().timestamp())),
-            "text": sanitized_text or "empty",
-            "text_full": sanitized_text or "empty",
-        }
+        now = datetime.now()
+        fields = self._template_fields
+        
+        template_vars = {}
+        if not fields.isdisjoint(("text", "text_full")):
+            sanitized_text = self.sanitize_filename(text) or "empty"
+            template_vars["text"] = sanitized_text
+            template_vars["text_full"] = sanitized_text
+        if not fields.isdisjoint(("date", "time", "datetime")):
+            # One strftime for all three clock fields
+            date, time, date_time = now.strftime("%Y-%m-%d|%H-%M-%S|%Y%m%d_%H%M%S").split("|")
+            template_vars["date"] = date
+            template_vars["time"] = time
+            template_vars["datetime"] = date_time
+        if "timestamp" in fields:
+            template_vars["timestamp"] = str(int(now.timestamp()))
         
         try:
-            filename = self.config["file_template"].format(**template_vars)
+            filename = self._render_template(template_vars)
         except KeyError as e:
             self.logger.warning(f"Invalid template variable: {e}. Using default.")
-            filename = f"clip_{template_vars['datetime']}.txt"
+            filename = f"clip_{now.strftime('%Y%m%d_%H%M%S')}.txt"
         
         return filename
     
     def show_filename_dialog(self, suggested_name: str = "") -> Optional[str]:
         """Show a popup dialog for custom filename input"""
+        import subprocess
+        
         try:
             # Use zenity to show a dialog for filename input
             cmd = [
@@ -134,18 +248,73 @@ class ClipboardSaver:
             self.logger.error(f"Error showing filename dialog: {e}")
             return None
     
+    def _notify(self, title: str, body: str, timeout: int = 3000) -> None:
+        """Show a desktop notification without waiting for notify-send to exit"""
+        import subprocess
+        
+        try:
+            subprocess.Popen(
+                ['notify-send', title, body, '-t', str(timeout)],
+                close_fds=True,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        except OSError as e:
+            self.logger.warning(f"Cannot show notification: {e}")
+    
+    def _find_previous_save(self, digest: bytes) -> Optional[str]:
+        """Return the path of the last save if it holds content with this digest"""
+        if self._last_hash is None:
+            try:
+                hex_digest, self._last_path = self.state_path.read_text(encoding='utf-8').split('\n', 1)
+                self._last_hash = bytes.fromhex(hex_digest)
+            except (OSError, ValueError):
+                self._last_hash = b""
+        
+        if digest == self._last_hash and os.path.exists(self._last_path):
+            return self._last_path
+        return None
+    
+    def _remember_save(self, digest: bytes, file_path: str) -> None:
+        """Record the digest and path of a successful save"""
+        self._last_hash = digest
+        self._last_path = file_path
+        try:
+            self.state_path.write_text(f"{digest.hex()}\n{self._last_path}", encoding='utf-8')
+        except OSError as e:
+            self.logger.warning(f"Cannot write save state: {e}")
+    
     def save_clipboard(self, custom_filename: Optional[str] = None, use_dialog: bool = False) -> bool:
         """Save current clipboard content to file"""
+        # Imported here so --list/--info don't pay for clipboard backend probing
+        # or loading the hash backend
+        import hashlib
+        import pyperclip
+        
         try:
             text = pyperclip.paste()
-            self.logger.info(f"Clipboard content length: {len(text)} characters")
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"Clipboard content length: {len(text)} characters")
             
-            if not text or not text.strip():
+            if not text or text.isspace():
                 self.logger.info("Clipboard is empty or contains only whitespace")
                 if self.config["notifications"]:
-                    os.system('notify-send "Clipboard Saver" "Clipboard is empty" -t 3000')
+                    self._notify("Clipboard Saver", "Clipboard is empty")
                 return False
             
+            data = text.encode('utf-8', 'surrogatepass')
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            
+            # Don't write the same content twice in a row (e.g. a double-tapped hotkey)
+            if not custom_filename and not use_dialog:
+                previous_path = self._find_previous_save(digest)
+                if previous_path is not None:
+                    self.logger.info(f"Clipboard unchanged, already saved to: {previous_path}")
+                    if self.config["notifications"]:
+                        self._notify("Clipboard Saver", "Clipboard already saved")
+                    return True
+            
             # Show dialog if requested
             if use_dialog:
                 suggested_name = self.create_filename(text)
@@ -162,47 +331,69 @@ class ClipboardSaver:
             else:
                 filename = self.create_filename(text)
             
-            file_path = self.save_dir / filename
+            # Plain strings here: this runs on every save and may retry
+            file_path = os.path.join(self._save_dir_str, filename)
+            stem, suffix = os.path.splitext(filename)
             
-            # Avoid overwriting existing files
-            counter = 1
-            original_path = file_path
-            while file_path.exists():
-                stem = original_path.stem
-                suffix = original_path.suffix
-                file_path = original_path.parent / f"{stem}_{counter:02d}{suffix}"
-                counter += 1
+            # Avoid overwriting existing files: let the kernel refuse an
+            # existing name instead of probing for it first
+            for counter in itertools.count():
+                if counter:
+                    file_path = os.path.join(self._save_dir_str, f"{stem}_{counter:02d}{suffix}")
+                try:
+                    fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o644)
+                    break
+                except FileExistsError:
+                    continue
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(text)
+            # The whole payload is known up front, so write the encoded bytes
+            # straight to the descriptor; one write() normally takes all of
+            # it and the loop only covers short writes
+            try:
+                view = memoryview(data)
+                written = 0
+                while written < len(view):
+                    written += os.write(fd, view[written:])
+            finally:
+                os.close(fd)
             
+            self._remember_save(digest, file_path)
             self.logger.info(f"Clipboard saved to: {file_path}")
             
             if self.config["notifications"]:
                 # Truncate filename for notification if too long
-                display_name = file_path.name
+                display_name = os.path.basename(file_path)
                 if len(display_name) > 40:
                     display_name = display_name[:37] + "..."
                 
                 save_type = "Custom" if custom_filename or use_dialog else "Quick"
-                os.system(f'notify-send "Clipboard Saved ({save_type})" "{display_name}" -t 3000')
+                self._notify(f"Clipboard Saved ({save_type})", display_name)
             
             return True
             
         except pyperclip.PyperclipException as e:
             self.logger.error(f"Clipboard access error: {e}")
             if self.config["notifications"]:
-                os.system('notify-send "Clipboard Error" "Cannot access clipboard" -t 5000')
+                self._notify("Clipboard Error", "Cannot access clipboard", timeout=5000)
             return False
         except Exception as e:
             self.logger.error(f"Unexpected error: {e}")
             if self.config["notifications"]:
-                os.system(f'notify-send "Error" "Failed to save clipboard: {str(e)[:50]}..." -t 5000')
+                self._notify("Error", f"Failed to save clipboard: {str(e)[:50]}...", timeout=5000)
             return False
     
     def list_saves(self, count: int = 10) -> None:
         """List recent saved files"""
-        files = sorted(self.save_dir.glob("*.txt"), key=os.path.getmtime, reverse=True)
+        from datetime import datetime
+        
+        # DirEntry caches stat results, so each file costs at most one stat()
+        files = []
+        with os.scandir(self.save_dir) as it:
+            for entry in it:
+                if _is_save_entry(entry):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.name))
+        files.sort(reverse=True)
         
         if not files:
             print("No saved clipboard files found.")
@@ -210,11 +401,10 @@ class ClipboardSaver:
         
         print(f"\nRecent clipboard saves (newest first):")
         print("-" * 80)
-        for i, file_path in enumerate(files[:count]):
-            size = file_path.stat().st_size
-            mtime = datetime.fromtimestamp(file_path.stat().st_mtime)
+        for i, (mtime, size, name) in enumerate(files[:count]):
+            mtime = datetime.fromtimestamp(mtime)
             print(f"{i+1:2d}. {mtime.strftime('%Y-%m-%d %H:%M:%S')} | "
-                  f"{size:6d} bytes | {file_path.name}")
+                  f"{size:6d} bytes | {name}")
     
     def show_info(self) -> None:
         """Show configuration information"""
@@ -226,8 +416,9 @@ class ClipboardSaver:
         print(f"Notifications: {self.config['notifications']}")
         
         # Count saved files
-        txt_files = list(self.save_dir.glob("*.txt"))
-        print(f"Total saved files: {len(txt_files)}")
+        with os.scandir(self.save_dir) as it:
+            total = sum(1 for entry in it if _is_save_entry(entry))
+        print(f"Total saved files: {total}")
         
         # Show hotkey configuration
         hotkeys = self.config.get("hotkeys", {})
@@ -243,26 +434,22 @@ class ClipboardSaver:
             "text": "example_text",
             "text_full": "example_text",
         }
-        example_name = self.config["file_template"].format(**example_vars)
+        try:
+            example_name = self._render_template(example_vars)
+        except KeyError:
+            example_name = f"clip_{example_vars['datetime']}.txt"
         print(f"Example filename: {example_name}")
 
 def create_default_config() -> None:
     """Create default configuration file"""
     config_dir = Path.home() / ".config" / "clipboard-saver"
-    config_dir.mkdir(parents=True, exist_ok=True)
+    _ensure_dir(config_dir)
     
     config_path = config_dir / "config.json"
     
     default_config = {
-        "save_dir": "~/Documents/clipboard_saves",
-        "file_template": "clip_{date}_{time}_{text:.20}.txt",
-        "max_filename_length": 50,
-        "notifications": True,
-        "log_level": "INFO",
-        "hotkeys": {
-            "quick_save": "Ctrl+Alt+s",
-            "custom_save": "Ctrl+Alt+f"
-        },
+        **_DEFAULT_CONFIG,
+        "hotkeys": dict(_DEFAULT_CONFIG["hotkeys"]),
         "_comment": "Available template variables: {date}, {time}, {datetime}, {timestamp}, {text}, {text_full}"
     }
     
@@ -273,6 +460,8 @@ def create_default_config() -> None:
 
 def main():
     """Main entry point"""
+    import argparse
+    
     parser = argparse.ArgumentParser(
         description="Clipboard Saver - Save clipboard content to files with GNOME hotkeys",
         epilog="Configure hotkey in GNOME Settings → Keyboard → Custom Shortcuts"